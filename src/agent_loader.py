@@ -0,0 +1,407 @@
+import json
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import google.cloud.dialogflow_v2 as dialogflow
+
+from google.cloud.dialogflow_v2.types.intent import Intent as DfIntent
+
+from dialogflow import Intent
+from entities import EntityType
+import scheduler
+
+
+INTENTS_DIR = "intents/"
+ENTITIES_DIR = "entities/"
+USERSAYS_SUFFIX = "_usersays_"
+ENTRIES_SUFFIX = "_entries_"
+
+# "platform" values used in exported messages, absent for the default platform
+PLATFORMS = {
+    "facebook": DfIntent.Message.Platform.FACEBOOK,
+    "slack": DfIntent.Message.Platform.SLACK,
+    "telegram": DfIntent.Message.Platform.TELEGRAM,
+    "kik": DfIntent.Message.Platform.KIK,
+    "skype": DfIntent.Message.Platform.SKYPE,
+    "line": DfIntent.Message.Platform.LINE,
+    "viber": DfIntent.Message.Platform.VIBER,
+    "google": DfIntent.Message.Platform.ACTIONS_ON_GOOGLE,
+    "hangouts": DfIntent.Message.Platform.GOOGLE_HANGOUTS,
+}
+
+KIND_INTENT = "intent"
+KIND_ENTITY_TYPE = "entity_type"
+
+# archives opened by a worker process, keyed by (path, project_id, language_code)
+WORKER_ARCHIVES = {}
+
+
+def bounded_map(func, items, max_workers=4):
+    """
+    Apply func to items on a process pool, keeping at most 2 * max_workers
+    results in flight so memory stays bounded regardless of archive size.
+    :param func: A picklable module level function
+    :param items: An iterable of picklable arguments
+    :param max_workers: The number of worker processes
+    :return: A generator yielding results in input order
+    """
+    window = max_workers * 2
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+class AgentArchive:
+    """
+    Read-only view of an agent export ZIP as produced by
+    `AgentsClient.export_agent`.
+    """
+
+    def __init__(self, path, project_id, language_code="en") -> None:
+        self._path = path
+        self._project_id = project_id
+        self._language_code = language_code
+        self._zip = None
+
+    @property
+    def agent_path(self):
+        return f"projects/{self._project_id}/agent"
+
+    @property
+    def language_code(self):
+        return self._language_code
+
+    def open(self):
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self._path)
+        return self
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read_json(self, member, default=None):
+        """
+        Decode a single archive member. Only one member is held in memory
+        per call.
+        """
+        try:
+            with self._zip.open(member) as fp:
+                return json.load(fp)
+        except KeyError:
+            return default
+
+    def members(self, directory, suffix):
+        for member in self._zip.namelist():
+            if not member.startswith(directory) or not member.endswith(".json"):
+                continue
+            if suffix in os.path.basename(member):
+                continue
+            yield member
+
+    def intent_members(self):
+        return self.members(INTENTS_DIR, USERSAYS_SUFFIX)
+
+    def entity_members(self):
+        return self.members(ENTITIES_DIR, ENTRIES_SUFFIX)
+
+    def companion(self, member, suffix):
+        return f"{member[:-len('.json')]}{suffix}{self._language_code}.json"
+
+    def intent_name(self, intent_id):
+        return f"{self.agent_path}/intents/{intent_id}" if intent_id else ""
+
+    def context_name(self, name):
+        return f"{self.agent_path}/sessions/-/contexts/{name}"
+
+    def build_intent(self, member):
+        return Intent(self.build_intent_obj(member))
+
+    def build_intent_obj(self, member):
+        data = self.read_json(member)
+        usersays = self.read_json(self.companion(member, USERSAYS_SUFFIX), [])
+
+        response = (data.get("responses") or [{}])[0]
+
+        training_phrases = []
+        for phrase in usersays:
+            parts = []
+            for part in phrase.get("data", []):
+                parts.append(
+                    {
+                        "text": part.get("text", ""),
+                        "entity_type": part.get("meta", ""),
+                        "alias": part.get("alias", ""),
+                        "user_defined": part.get("userDefined", False),
+                    }
+                )
+            training_phrases.append(
+                {
+                    "type_": "TEMPLATE" if phrase.get("isTemplate") else "EXAMPLE",
+                    "parts": parts,
+                    "times_added_count": phrase.get("count", 0),
+                }
+            )
+
+        parameters = []
+        for param in response.get("parameters", []):
+            parameters.append(
+                {
+                    "display_name": param.get("name", ""),
+                    "entity_type_display_name": param.get("dataType", ""),
+                    "value": param.get("value", ""),
+                    "default_value": param.get("defaultValue", ""),
+                    "mandatory": param.get("required", False),
+                    "is_list": param.get("isList", False),
+                    "prompts": [
+                        prompt["value"]
+                        for prompt in param.get("prompts", [])
+                        if prompt.get("lang", self._language_code)
+                        == self._language_code
+                    ],
+                }
+            )
+
+        messages = []
+        for message in response.get("messages", []):
+            if message.get("lang", self._language_code) != self._language_code:
+                continue
+
+            platform = message.get("platform")
+            if platform and platform not in PLATFORMS:
+                continue
+            platform = PLATFORMS.get(
+                platform, DfIntent.Message.Platform.PLATFORM_UNSPECIFIED
+            )
+
+            message_type = str(message.get("type", "0"))
+            if message_type == "0":
+                speech = message.get("speech", [])
+                if isinstance(speech, str):
+                    speech = [speech]
+                messages.append(
+                    DfIntent.Message(text={"text": speech}, platform=platform)
+                )
+            elif message_type == "4":
+                messages.append(
+                    DfIntent.Message(
+                        payload=message.get("payload", {}), platform=platform
+                    )
+                )
+
+        intent_obj = DfIntent(
+            name=self.intent_name(data.get("id")),
+            display_name=data.get("name", ""),
+            priority=data.get("priority", 0),
+            is_fallback=data.get("fallbackIntent", False),
+            webhook_state=(
+                DfIntent.WebhookState.WEBHOOK_STATE_ENABLED
+                if data.get("webhookUsed")
+                else DfIntent.WebhookState.WEBHOOK_STATE_UNSPECIFIED
+            ),
+            events=[event["name"] for event in data.get("events", [])],
+            input_context_names=[
+                self.context_name(name) for name in data.get("contexts", [])
+            ],
+            output_contexts=[
+                {
+                    "name": self.context_name(context["name"]),
+                    "lifespan_count": context.get("lifespan", 0),
+                }
+                for context in response.get("affectedContexts", [])
+            ],
+            reset_contexts=response.get("resetContexts", False),
+            action=response.get("action", ""),
+            parameters=parameters,
+            messages=messages,
+            training_phrases=training_phrases,
+            root_followup_intent_name=self.intent_name(data.get("rootParentId")),
+            parent_followup_intent_name=self.intent_name(data.get("parentId")),
+        )
+
+        return intent_obj
+
+    def build_entity_type(self, member):
+        return EntityType(self.build_entity_obj(member))
+
+    def build_entity_obj(self, member):
+        data = self.read_json(member)
+        entries = self.read_json(self.companion(member, ENTRIES_SUFFIX), [])
+
+        if data.get("isRegexp"):
+            kind = dialogflow.EntityType.Kind.KIND_REGEXP
+        elif data.get("isEnum"):
+            kind = dialogflow.EntityType.Kind.KIND_LIST
+        else:
+            kind = dialogflow.EntityType.Kind.KIND_MAP
+
+        entity_obj = dialogflow.EntityType(
+            name=f"{self.agent_path}/entityTypes/{data.get('id', '')}",
+            display_name=data.get("name", ""),
+            kind=kind,
+            auto_expansion_mode=(
+                dialogflow.EntityType.AutoExpansionMode.AUTO_EXPANSION_MODE_DEFAULT
+                if data.get("automatedExpansion")
+                else dialogflow.EntityType.AutoExpansionMode.AUTO_EXPANSION_MODE_UNSPECIFIED
+            ),
+            enable_fuzzy_extraction=data.get("allowFuzzyExtraction", False),
+            entities=[
+                {"value": entry["value"], "synonyms": entry.get("synonyms", [])}
+                for entry in entries
+            ],
+        )
+
+        return entity_obj
+
+    def tasks(self, kind, members):
+        for member in members:
+            yield self._path, self._project_id, self._language_code, kind, member
+
+    def intents(self, max_workers=4):
+        """
+        Build every intent in the archive on max_workers processes. Workers
+        send back serialized protos, which are cheap to parse here. With
+        max_workers of 1 or less intents are built in this process.
+        """
+        if not max_workers or max_workers <= 1:
+            yield from map(self.build_intent, self.intent_members())
+            return
+
+        tasks = self.tasks(KIND_INTENT, self.intent_members())
+        for data in bounded_map(build_member, tasks, max_workers):
+            yield Intent(DfIntent.deserialize(data))
+
+    def entity_types(self, max_workers=4):
+        if not max_workers or max_workers <= 1:
+            yield from map(self.build_entity_type, self.entity_members())
+            return
+
+        tasks = self.tasks(KIND_ENTITY_TYPE, self.entity_members())
+        for data in bounded_map(build_member, tasks, max_workers):
+            yield EntityType(dialogflow.EntityType.deserialize(data))
+
+
+def build_member(task):
+    """
+    Build one archive member into a serialized proto. Runs in a worker
+    process, which keeps its own handle on the archive between tasks.
+    """
+    path, project_id, language_code, kind, member = task
+
+    key = (path, project_id, language_code)
+    archive = WORKER_ARCHIVES.get(key)
+    if archive is None:
+        archive = WORKER_ARCHIVES[key] = AgentArchive(*key).open()
+
+    if kind == KIND_INTENT:
+        return DfIntent.serialize(archive.build_intent_obj(member))
+    return dialogflow.EntityType.serialize(archive.build_entity_obj(member))
+
+
+def export_agent(df, path, timeout=None):
+    """
+    Trigger an agent export through `df.agents_client` and write the
+    resulting ZIP to path.
+    :param df: A Dialogflow instance
+    :param path: Destination file path
+    :param timeout: Seconds to wait for the export operation
+    :return: The path written
+    """
+    request = {"parent": f"projects/{df.project_id}"}
+
+    with df.schedule(scheduler.AGENTS):
+        operation = df.agents_client.export_agent(request=request)
+    response = operation.result(timeout=timeout)
+
+    with open(path, "wb") as fp:
+        fp.write(response.agent_content)
+
+    return path
+
+
+def load_agent(path, df=None, entity_client=None, language_code="en", max_workers=4):
+    """
+    Populate the intent and entity type caches from an agent export ZIP
+    without calling the API.
+    :param path: Path to the exported agent ZIP
+    :param df: A Dialogflow instance whose intent cache is filled
+    :param entity_client: An EntityClient whose entity cache is filled
+    :param language_code: Language of training phrases and entries to load
+    :param max_workers: The number of worker processes
+    :return: A tuple of (intent count, entity type count)
+    """
+    client = df or entity_client
+    if client is None:
+        raise Exception("Nothing to load into! Provide a Dialogflow or EntityClient.")
+
+    intent_count = 0
+    entity_count = 0
+
+    with AgentArchive(path, client.project_id, language_code) as archive:
+        if df is not None:
+            for intent in archive.intents(max_workers):
+                df.cache_intent(intent)
+                intent_count += 1
+
+        if entity_client is not None:
+            for entity in archive.entity_types(max_workers):
+                entity_client.cache(entity)
+                entity_count += 1
+
+    return intent_count, entity_count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dialogflow import Dialogflow
+    from entities import EntityClient
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--project_id", dest="project_id", type=str, help="Google Cloud Project Id"
+    )
+    parser.add_argument(
+        "--credential",
+        dest="credential",
+        type=str,
+        help="Path to Google Cloud Project credential",
+    )
+    parser.add_argument(
+        "--archive", dest="archive", type=str, help="Path to agent export ZIP"
+    )
+    parser.add_argument(
+        "--download",
+        dest="download",
+        action="store_true",
+        help="Export the agent to --archive before loading",
+    )
+
+    args = parser.parse_args()
+
+    config = {"project_id": args.project_id, "credential": args.credential}
+
+    df = Dialogflow(config)
+    client = EntityClient(config)
+
+    if args.download:
+        export_agent(df, args.archive)
+
+    print(load_agent(args.archive, df, client))
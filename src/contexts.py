@@ -0,0 +1,139 @@
+import threading
+import time
+
+import google.cloud.dialogflow_v2 as dialogflow
+
+
+# contexts expire on the server after this many seconds without a turn
+CONTEXT_EXPIRY = 20 * 60
+
+
+def context_id(name: str) -> str:
+    return name.split("/")[-1]
+
+
+def copy_context(context):
+    return dialogflow.Context.deserialize(dialogflow.Context.serialize(context))
+
+
+class ContextStore:
+    """
+    Local mirror of the active contexts of one session. It is kept up to
+    date from every detect_intent response so context queries need no
+    round trip; when it cannot be trusted it is marked out of sync and the
+    owner refreshes it with a single list_contexts call. It also goes out
+    of sync once the session has been idle longer than the server keeps
+    contexts alive.
+    """
+
+    def __init__(self, session_path="", expiry=CONTEXT_EXPIRY) -> None:
+        self._session_path = session_path
+        self._contexts = {}
+        self._synced = True
+        self._expiry = expiry
+        self._touched = time.monotonic()
+        self._loaded = self._touched
+        self._lock = threading.Lock()
+
+    @property
+    def session_path(self):
+        return self._session_path
+
+    @property
+    def synced(self):
+        return self._synced and not self.expired
+
+    @property
+    def expired(self):
+        """
+        True once the server may have dropped the contexts for idleness and
+        the mirror has not been reloaded since.
+        """
+        deadline = self._touched + self._expiry
+        return time.monotonic() > deadline and self._loaded <= deadline
+
+    def touch(self):
+        self._touched = time.monotonic()
+
+    def reset(self, session_path):
+        with self._lock:
+            self._session_path = session_path
+            self._contexts = {}
+            self._synced = True
+            self.touch()
+
+    def invalidate(self):
+        self._synced = False
+
+    def put(self, context):
+        with self._lock:
+            self.set(context)
+            self.touch()
+
+    def set(self, context):
+        if context.lifespan_count > 0:
+            self._contexts[context_id(context.name)] = copy_context(context)
+        else:
+            self._contexts.pop(context_id(context.name), None)
+
+    def load(self, contexts):
+        """
+        Replace the mirror with the contexts returned by the server. Listing
+        does not keep the session alive on the server, so the idle timer is
+        left alone; the reload time is recorded instead and keeps the mirror
+        trusted until the next turn or failure.
+        """
+        with self._lock:
+            self._contexts = {}
+            for context in contexts:
+                self.set(context)
+            self._synced = True
+            self._loaded = time.monotonic()
+
+    def advance(self, query_result):
+        """
+        Apply one conversational turn: every active context loses one turn
+        of lifespan, then the output contexts of the turn are applied.
+        """
+        with self._lock:
+            for key in list(self._contexts):
+                context = self._contexts[key]
+                context.lifespan_count -= 1
+                if context.lifespan_count <= 0:
+                    del self._contexts[key]
+
+            for context in query_result.output_contexts:
+                self.set(context)
+
+            self.touch()
+
+    def owns(self, name) -> bool:
+        """
+        Whether name is a bare context id or a full context name in this
+        store's session.
+        """
+        if "/" not in name:
+            return True
+        return name == f"{self._session_path}/contexts/{context_id(name)}"
+
+    def get(self, name):
+        if not self.owns(name):
+            return None
+
+        with self._lock:
+            context = self._contexts.get(context_id(name))
+            return copy_context(context) if context is not None else None
+
+    def contexts(self) -> list:
+        with self._lock:
+            return [copy_context(context) for context in self._contexts.values()]
+
+    def names(self) -> list:
+        with self._lock:
+            return list(self._contexts)
+
+    def __contains__(self, name):
+        return context_id(name) in self._contexts
+
+    def __len__(self):
+        return len(self._contexts)
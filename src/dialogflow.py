@@ -1,13 +1,20 @@
 import os
 import sys
+import time
 from uuid import uuid4
 
 import google.cloud.dialogflow_v2 as dialogflow
+import grpc
+
+from google.api_core.exceptions import NotFound
 
 from google.cloud.dialogflow_v2.types.intent import Intent as DfIntent
 from proto.marshal.collections.maps import MapComposite
 
+from contexts import ContextStore
 from protobuf_helpers import protobuf_to_dict
+import scheduler
+import validator
 
 
 class Intent:
@@ -55,7 +62,7 @@ class Intent:
     def custom_payload(self):
         payload = {}
         for message in self._intent_obj.messages:
-            if message.payload:
+            if message.payload and not message.platform:
                 payload = message.payload
 
         return self.deserialize_custom_payload(payload)
@@ -122,50 +129,46 @@ class Intent:
         return super().__repr__()
 
     def __str__(self) -> str:
-        ret_val = ""
+        lines = []
 
-        ret_val += "=" * 80
-        ret_val += f"Intent name: {self.intent_obj.name}"
-        ret_val += f"Intent display_name: {self.intent_obj.display_name}"
-        ret_val += f"Root followup intent: {self.intent_obj.root_followup_intent_name}"
-        ret_val += (
+        lines.append("=" * 80)
+        lines.append(f"Intent name: {self.intent_obj.name}")
+        lines.append(f"Intent display_name: {self.intent_obj.display_name}")
+        lines.append(f"Root followup intent: {self.intent_obj.root_followup_intent_name}")
+        lines.append(
             f"Parent followup intent: {self.intent_obj.parent_followup_intent_name}\n"
         )
 
-        ret_val += "Input contexts:"
+        lines.append("Input contexts:")
         for input_context_name in self.intent_obj.input_context_names:
-            ret_val += f"\tName: {input_context_name}"
+            lines.append(f"\tName: {input_context_name}")
 
-        ret_val += "Output contexts:"
+        lines.append("Output contexts:")
         for output_context in self.intent_obj.output_contexts:
-            ret_val += f"\tName: {output_context.name}"
+            lines.append(f"\tName: {output_context.name}")
 
         if self.intent_obj.action:
-            ret_val += f"Action: {self.intent_obj.action}\n"
+            lines.append(f"Action: {self.intent_obj.action}\n")
 
         if len(self.intent_obj.parameters) > 0:
-            ret_val += "Parameters:"
+            lines.append("Parameters:")
             for param in self.intent_obj.parameters:
-                ret_val += f"\tname: {param.name}"
-                ret_val += f"\tdisplay_name: {param.display_name}"
-                ret_val += (
+                lines.append(f"\tname: {param.name}")
+                lines.append(f"\tdisplay_name: {param.display_name}")
+                lines.append(
                     f"\tentity_type_display_name: {param.entity_type_display_name}"
                 )
-
-                ret_val += f"\tvalue: {param.value}"
+                lines.append(f"\tvalue: {param.value}")
 
         if len(self.intent_obj.training_phrases) > 0:
-            ret_val += "Training Phrases:"
-            for phrase in self.intent_obj.training_phrases:
-                full_phrase = ""
-                for part in phrase.parts:
-                    full_phrase += part.text
-                    # ret_val += f"\t{part}")
-                ret_val += f"\t{full_phrase}"
-
-            ret_val += "=" * 80
-            ret_val += "\n"
-            ret_val += "\n"
+            lines.append("Training Phrases:")
+            for phrase in self.training_phrases:
+                lines.append(f"\t{phrase}")
+
+        lines.append("=" * 80)
+        lines.append("\n")
+
+        return "\n".join(lines)
 
     def serialize_custom_payload(self, payload: dict) -> dict:
         # Convert unsupported types to supported types
@@ -191,10 +194,10 @@ class Dialogflow:
         self.configure()
 
         self._clients = {
-            "agents": dialogflow.AgentsClient(),
-            "intents": dialogflow.IntentsClient(),
-            "sessions": dialogflow.SessionsClient(),
-            "contexts": dialogflow.ContextsClient(),
+            "agents": self.create_client(dialogflow.AgentsClient),
+            "intents": self.create_client(dialogflow.IntentsClient),
+            "sessions": self.create_client(dialogflow.SessionsClient),
+            "contexts": self.create_client(dialogflow.ContextsClient),
         }
 
         self._intents = {"name": {}, "display_name": {}}
@@ -202,6 +205,12 @@ class Dialogflow:
         self._session_id = ""
         self._session_path = ""
 
+        self._scheduler = config.get("scheduler", None)
+
+        self._contexts = ContextStore()
+
+        self._recorder = config.get("recorder", None)
+
     @property
     def project_id(self):
         return self._config.get("project_id", "")
@@ -210,6 +219,14 @@ class Dialogflow:
     def credential(self):
         return self._config.get("credential", "")
 
+    @property
+    def api_endpoint(self):
+        return self._config.get("api_endpoint", "")
+
+    @property
+    def session_id(self):
+        return self._session_id
+
     @property
     def agents_client(self):
         return self._clients.get("agents", None)
@@ -230,12 +247,30 @@ class Dialogflow:
     def intents(self):
         return self._intents
 
+    def schedule(self, family, priority=scheduler.BULK):
+        return scheduler.scheduled(self._scheduler, family, priority)
+
+    def create_client(self, client_class):
+        if not self.api_endpoint:
+            return client_class()
+
+        if self._config.get("insecure", False):
+            transport_class = client_class.get_transport_class("grpc")
+            channel = grpc.insecure_channel(self.api_endpoint)
+            return client_class(transport=transport_class(channel=channel))
+
+        return client_class(client_options={"api_endpoint": self.api_endpoint})
+
     def create_session(self, contexts=[]):
-        self._session_id = uuid4().hex
+        self.use_session(uuid4().hex)
+        self.create_contexts_by_name(self._session_path, contexts)
+
+    def use_session(self, session_id):
+        self._session_id = session_id
         self._session_path = self.sessions_client.session_path(
             self.project_id, self._session_id
         )
-        self.create_contexts_by_name(self._session_path, contexts)
+        self._contexts.reset(self._session_path)
 
     def configure(self):
 
@@ -257,18 +292,23 @@ class Dialogflow:
 
         parent = self.agents_client.agent_path(self.project_id)
 
-        intents = self.intents_client.list_intents(
-            request={"parent": parent, "intent_view": 1}
-        )
+        with self.schedule(scheduler.INTENTS):
+            intents = self.intents_client.list_intents(
+                request={"parent": parent, "intent_view": 1}
+            )
 
-        for intent in intents:
-            self._intents["name"][intent.name] = Intent(intent)
-            self._intents["display_name"][intent.display_name] = self._intents["name"][
-                intent.name
-            ]
+        for page in scheduler.scheduled_pages(
+            self._scheduler, scheduler.INTENTS, intents.pages
+        ):
+            for intent in page.intents:
+                self.cache_intent(Intent(intent))
 
         return intents
 
+    def cache_intent(self, intent):
+        self._intents["name"][intent.intent_obj.name] = intent
+        self._intents["display_name"][intent.intent_obj.display_name] = intent
+
     def create_intent(self, intent):
 
         parent = self.agents_client.agent_path(self.project_id)
@@ -279,7 +319,8 @@ class Dialogflow:
             "intent_view": 1,
         }
 
-        return self.intents_client.create_intent(request)
+        with self.schedule(scheduler.INTENTS):
+            return self.intents_client.create_intent(request)
 
     def update_intent(self, intent):
         intent.root_followup_intent_name = ""
@@ -290,9 +331,15 @@ class Dialogflow:
             "intent_view": 1,
         }
 
-        return self.intents_client.update_intent(request)
+        with self.schedule(scheduler.INTENTS):
+            return self.intents_client.update_intent(request)
 
-    def batch_update_intents(self, intents):
+    def batch_update_intents(self, intents, validate=True):
+
+        if validate:
+            validator.raise_for_issues(
+                validator.validate_intents(intents, self._intents["name"].values())
+            )
 
         for intent in intents:
             intent.root_followup_intent_name = ""
@@ -305,14 +352,16 @@ class Dialogflow:
             "intent_view": 1,
         }
 
-        operation = self.intents_client.batch_update_intents(request=request)
+        with self.schedule(scheduler.INTENTS):
+            operation = self.intents_client.batch_update_intents(request=request)
 
         return operation.result()
 
     def delete_intent(self, intent_name):
         request = {"name": intent_name}
 
-        return self.intents_client.delete_intent(request)
+        with self.schedule(scheduler.INTENTS):
+            return self.intents_client.delete_intent(request)
 
     def batch_delete_intents(self, intents):
         parent = self.agents_client.agent_path(self.project_id)
@@ -321,7 +370,8 @@ class Dialogflow:
             "intents": intents,
         }
 
-        operation = self.intents_client.batch_delete_intents(request=request)
+        with self.schedule(scheduler.INTENTS):
+            operation = self.intents_client.batch_delete_intents(request=request)
 
         return operation.result()
 
@@ -351,26 +401,70 @@ class Dialogflow:
             "query_input": query_input,
         }
 
-        return self.sessions_client.detect_intent(request=request)
+        started = time.time()
+        error = None
 
-    def list_contexts(self):
+        try:
+            with self.schedule(scheduler.SESSIONS, scheduler.INTERACTIVE):
+                response = self.sessions_client.detect_intent(request=request)
+        except Exception as e:
+            error = e
+            self._contexts.invalidate()
+            raise
+        finally:
+            if self._recorder is not None:
+                self._recorder.record(
+                    self._session_id,
+                    query,
+                    context_names,
+                    started,
+                    time.time() - started,
+                    error,
+                )
+
+        self._contexts.advance(response.query_result)
+
+        return response
+
+    @property
+    def contexts(self):
+        return self._contexts
+
+    def refresh_contexts(self):
         request = {
             "parent": self._session_path,
         }
 
-        return self.contexts_client.list_contexts(request=request)
+        with self.schedule(scheduler.CONTEXTS, scheduler.INTERACTIVE):
+            self._contexts.load(self.contexts_client.list_contexts(request=request))
+
+        return self._contexts.contexts()
+
+    def list_contexts(self):
+        if not self._contexts.synced:
+            return self.refresh_contexts()
+
+        return self._contexts.contexts()
 
     def create_context(self, parent, context):
         request = {"parent": parent, "context": {"name": context}}
 
-        return self.contexts_client.create_context(request=request)
+        try:
+            with self.schedule(scheduler.CONTEXTS, scheduler.INTERACTIVE):
+                response = self.contexts_client.create_context(request=request)
+        except Exception:
+            self._contexts.invalidate()
+            raise
+
+        if parent == self._session_path:
+            self._contexts.put(response)
+
+        return response
 
     def create_contexts(self, parent, contexts):
         for context in contexts:
             try:
-                request = {"parent": parent, "context": {"name": context}}
-
-                response = self.contexts_client.create_context(request=request)
+                response = self.create_context(parent, context)
             except Exception as e:
                 pass
 
@@ -387,18 +481,33 @@ class Dialogflow:
         for name in names:
             response = self.create_context_by_name(session_path, name)
 
-    def get_context(self, name):
+    def get_remote_context(self, name):
         request = {"name": name}
 
-        return self.contexts_client.get_context(request=request)
+        with self.schedule(scheduler.CONTEXTS, scheduler.INTERACTIVE):
+            return self.contexts_client.get_context(request=request)
+
+    def get_context(self, name):
+        if not self._contexts.owns(name):
+            return self.get_remote_context(name)
+
+        if not self._contexts.synced:
+            self.refresh_contexts()
+
+        context = self._contexts.get(name)
+        if context is None:
+            raise NotFound(f"Context not found: {name}")
+
+        return context
 
     def get_contexts(self, names):
+        if not self._contexts.synced and any(map(self._contexts.owns, names)):
+            self.refresh_contexts()
+
         contexts = []
         for name in names:
             try:
-                request = {"name": name}
-
-                contexts.append(self.contexts_client.get_context(request=request))
+                contexts.append(self.get_context(name))
             except Exception as e:
                 pass
         return contexts
@@ -406,47 +515,7 @@ class Dialogflow:
     def display_intents(self):
 
         for key in self._intents["name"]:
-            intent = self._intents["name"][key]._intent_obj
-
-            print("=" * 80)
-            print(f"Intent name: {intent.name}")
-            print(f"Intent display_name: {intent.display_name}")
-            print(f"Root followup intent: {intent.root_followup_intent_name}")
-            print(f"Parent followup intent: {intent.parent_followup_intent_name}\n")
-
-            print("Input contexts:")
-            for input_context_name in intent.input_context_names:
-                print(f"\tName: {input_context_name}")
-
-            print("Output contexts:")
-            for output_context in intent.output_contexts:
-                print(f"\tName: {output_context.name}")
-
-            if intent.action:
-                print(f"Action: {intent.action}\n")
-
-            if len(intent.parameters) > 0:
-                print("Parameters:")
-                for param in intent.parameters:
-                    print(f"\tname: {param.name}")
-                    print(f"\tdisplay_name: {param.display_name}")
-                    print(
-                        f"\tentity_type_display_name: {param.entity_type_display_name}"
-                    )
-                    print(f"\tvalue: {param.value}")
-
-            if len(intent.training_phrases) > 0:
-                print("Training Phrases:")
-                for phrase in intent.training_phrases:
-                    full_phrase = ""
-                    for part in phrase.parts:
-                        full_phrase += part.text
-                        # print(f"\t{part}")
-                    print(f"\t{full_phrase}")
-
-            print("=" * 80)
-            print()
-            print()
+            print(self._intents["name"][key])
 
     def create_tree(self):
         for key in self.intents["name"]:
@@ -461,6 +530,8 @@ class Dialogflow:
 if __name__ == "__main__":
     import argparse
 
+    from replay import Recorder
+
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
@@ -472,40 +543,58 @@ if __name__ == "__main__":
         type=str,
         help="Path to Google Cloud Project credential",
     )
+    parser.add_argument(
+        "--endpoint", dest="endpoint", type=str, default="", help="API endpoint"
+    )
+    parser.add_argument(
+        "--insecure",
+        dest="insecure",
+        action="store_true",
+        help="Use a plaintext channel, e.g. for a local stand-in server",
+    )
+    parser.add_argument(
+        "--context",
+        dest="contexts",
+        action="append",
+        default=[],
+        help="Input context name, may be repeated",
+    )
+    parser.add_argument(
+        "--record",
+        dest="record",
+        type=str,
+        default="",
+        help="Record detect_intent calls to this log, e.g. traffic.jsonl.gz",
+    )
+    parser.add_argument(
+        "queries", nargs="*", help="Queries to send, read from stdin if omitted"
+    )
 
     args = parser.parse_args()
 
-    config = {"project_id": args.project_id, "credential": args.credential}
-
-    df = Dialogflow(config)
-    df.get_intents()
-    # df.display_intents()
-
-    query = "i love to travel"
-
-    intent_name = "travel-during-summer"
-    intent = df._intents["display_name"][intent_name]
-    contexts = intent.input_context_names
-    params = intent.parameters
+    config = {
+        "project_id": args.project_id,
+        "credential": args.credential,
+        "api_endpoint": args.endpoint,
+        "insecure": args.insecure,
+    }
 
-    df.create_session(contexts)
+    if args.record:
+        config["recorder"] = Recorder(args.record)
 
-    print()
-    print("*" * 80)
-    print(f"Session ID: {df._session_id}")
-    print("*" * 80)
-
-    # print("*" * 80)
-    # print("LIST CONTEXTS")
-    # print("*" * 80)
-    # for response in df.list_contexts():
-    #     print(response)
+    df = Dialogflow(config)
+    df.create_session(args.contexts)
 
-    print()
+    print(f"Session ID: {df.session_id}")
 
-    print("*" * 80)
-    print("DETECT INTENT")
-    print("*" * 80)
+    queries = args.queries or (line.strip() for line in sys.stdin)
 
-    response = df.detect_intent(query, contexts)
-    print(response)
+    try:
+        for query in queries:
+            if not query:
+                continue
+            response = df.detect_intent(query, args.contexts)
+            print(response.query_result)
+    finally:
+        if args.record:
+            config["recorder"].close()
@@ -4,6 +4,9 @@ import os
 
 import google.cloud.dialogflow_v2 as dialogflow
 
+import scheduler
+import validator
+
 
 class EntityType:
     def __init__(self, entity_obj=None) -> None:
@@ -14,6 +17,10 @@ class EntityType:
         for value in self.values:
             self._value_map[value.value] = value
 
+    @property
+    def entity_obj(self):
+        return self._entity_obj
+
     @property
     def name(self):
         return self._entity_obj.name
@@ -64,6 +71,8 @@ class EntityClient:
 
         self._entities = {"name": {}, "display_name": {}}
 
+        self._scheduler = config.get("scheduler", None)
+
     def configure(self):
 
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = self.credential
@@ -96,6 +105,13 @@ class EntityClient:
     def entity_types_client(self):
         return self._client
 
+    @property
+    def entities(self):
+        return self._entities
+
+    def schedule(self, family, priority=scheduler.BULK):
+        return scheduler.scheduled(self._scheduler, family, priority)
+
     def batch_create(self):
         pass
 
@@ -111,14 +127,22 @@ class EntityClient:
     def batch_update(self):
         pass
 
-    def batch_update_types(self, entity_types):
+    def batch_update_types(self, entity_types, validate=True):
+
+        if validate:
+            validator.raise_for_issues(
+                validator.validate_entity_types(
+                    entity_types, self._entities["name"].values()
+                )
+            )
 
         request = {
             "parent": self.parent,
             "entity_type_batch_inline": {"entity_types": entity_types},
         }
 
-        operation = self._client.batch_update_entity_types(request=request)
+        with self.schedule(scheduler.ENTITY_TYPES):
+            operation = self._client.batch_update_entity_types(request=request)
 
         return operation.result()
 
@@ -129,7 +153,8 @@ class EntityClient:
             "entity_type": entity_type,
         }
 
-        return self._client.create_entity_type(request=request)
+        with self.schedule(scheduler.ENTITY_TYPES):
+            return self._client.create_entity_type(request=request)
 
     def update(self, entity_type):
 
@@ -137,7 +162,8 @@ class EntityClient:
             "entity_type": entity_type,
         }
 
-        return self._client.update_entity_type(request=request)
+        with self.schedule(scheduler.ENTITY_TYPES):
+            return self._client.update_entity_type(request=request)
 
     def delete(self):
         pass
@@ -149,13 +175,18 @@ class EntityClient:
 
         request = {"parent": self.parent}
 
-        page_result = self.entity_types_client.list_entity_types(request=request)
+        with self.schedule(scheduler.ENTITY_TYPES):
+            page_result = self.entity_types_client.list_entity_types(request=request)
 
-        for response in page_result:
-            entity = EntityType(response)
+        for page in scheduler.scheduled_pages(
+            self._scheduler, scheduler.ENTITY_TYPES, page_result.pages
+        ):
+            for response in page.entity_types:
+                self.cache(EntityType(response))
 
-            self._entities["name"][entity.name] = entity
-            self._entities["display_name"][entity.display_name] = entity
+    def cache(self, entity):
+        self._entities["name"][entity.name] = entity
+        self._entities["display_name"][entity.display_name] = entity
 
 
 if __name__ == "__main__":
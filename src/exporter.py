@@ -0,0 +1,208 @@
+import bz2
+import gzip
+import json
+import lzma
+
+import google.cloud.dialogflow_v2 as dialogflow
+
+from google.cloud.dialogflow_v2.types.intent import Intent as DfIntent
+
+from dialogflow import Intent
+from entities import EntityType
+
+
+KIND_INTENT = "intent"
+KIND_ENTITY_TYPE = "entity_type"
+
+COMPRESSORS = {
+    None: open,
+    "gzip": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+
+EXTENSIONS = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "xz",
+}
+
+
+def infer_compression(path):
+    for extension, compression in EXTENSIONS.items():
+        if str(path).endswith(extension):
+            return compression
+    return None
+
+
+def open_stream(path, mode, compression="infer"):
+    """
+    Open a text stream, transparently (de)compressing it.
+    :param path: The file path
+    :param mode: "r" or "w"
+    :param compression: One of None, "gzip", "bz2", "xz" or "infer"
+    :return: A text file object
+    """
+    if compression == "infer":
+        compression = infer_compression(path)
+
+    if compression not in COMPRESSORS:
+        raise Exception(f"Unsupported compression: {compression}")
+
+    return COMPRESSORS[compression](path, f"{mode}t", encoding="utf-8")
+
+
+def intent_to_record(intent: Intent) -> dict:
+    """
+    Convert a cached Intent into a JSON serializable record. The full
+    intent is kept so the record can be loaded back; training phrases
+    and the custom payload are also flattened for easy diffing.
+    :param intent: The Intent
+    :return: The record
+    """
+    return {
+        "kind": KIND_INTENT,
+        "display_name": intent.intent_obj.display_name,
+        "training_phrases": intent.training_phrases,
+        "custom_payload": intent.custom_payload,
+        "data": DfIntent.to_dict(intent.intent_obj),
+    }
+
+
+def entity_type_to_record(entity: EntityType) -> dict:
+    """
+    Convert a cached EntityType into a JSON serializable record.
+    :param entity: The EntityType
+    :return: The record
+    """
+    return {
+        "kind": KIND_ENTITY_TYPE,
+        "display_name": entity.display_name,
+        "data": dialogflow.EntityType.to_dict(entity.entity_obj),
+    }
+
+
+def record_to_object(record: dict):
+    """
+    Convert a record back into an Intent or EntityType.
+    :param record: The record
+    :return: The Intent or EntityType
+    """
+    kind = record.get("kind")
+
+    if kind == KIND_INTENT:
+        return Intent(DfIntent(record["data"]))
+    elif kind == KIND_ENTITY_TYPE:
+        return EntityType(dialogflow.EntityType(record["data"]))
+
+    raise Exception(f"Unknown record kind: {kind}")
+
+
+def iter_records(df=None, entity_client=None):
+    """
+    Lazily yield records for every cached intent and entity type, sorted
+    by display name so successive exports diff cleanly.
+    """
+    if df is not None:
+        intents = df.intents["display_name"]
+        for display_name in sorted(intents):
+            yield intent_to_record(intents[display_name])
+
+    if entity_client is not None:
+        entities = entity_client.entities["display_name"]
+        for display_name in sorted(entities):
+            yield entity_type_to_record(entities[display_name])
+
+
+def write_jsonl(records, path, compression="infer"):
+    """
+    Write records to path, one compact JSON document per line.
+    :param records: An iterable of records
+    :param path: Destination file path
+    :param compression: One of None, "gzip", "bz2", "xz" or "infer"
+    :return: The number of records written
+    """
+    count = 0
+
+    with open_stream(path, "w", compression) as fp:
+        for record in records:
+            fp.write(json.dumps(record, separators=(",", ":"), sort_keys=True))
+            fp.write("\n")
+            count += 1
+
+    return count
+
+
+def read_jsonl(path, compression="infer"):
+    """
+    Lazily read records written by `write_jsonl`.
+    :param path: Source file path
+    :param compression: One of None, "gzip", "bz2", "xz" or "infer"
+    :return: A generator of records
+    """
+    with open_stream(path, "r", compression) as fp:
+        for line in fp:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def write_agent_jsonl(path, df=None, entity_client=None, compression="infer"):
+    return write_jsonl(iter_records(df, entity_client), path, compression)
+
+
+def read_agent_jsonl(path, df=None, entity_client=None, compression="infer"):
+    """
+    Fill the intent and entity type caches from a JSONL export.
+    :return: A tuple of (intent count, entity type count)
+    """
+    intent_count = 0
+    entity_count = 0
+
+    for record in read_jsonl(path, compression):
+        kind = record.get("kind")
+        if kind == KIND_INTENT and df is not None:
+            df.cache_intent(record_to_object(record))
+            intent_count += 1
+        elif kind == KIND_ENTITY_TYPE and entity_client is not None:
+            entity_client.cache(record_to_object(record))
+            entity_count += 1
+
+    return intent_count, entity_count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dialogflow import Dialogflow
+    from entities import EntityClient
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--project_id", dest="project_id", type=str, help="Google Cloud Project Id"
+    )
+    parser.add_argument(
+        "--credential",
+        dest="credential",
+        type=str,
+        help="Path to Google Cloud Project credential",
+    )
+    parser.add_argument(
+        "--output",
+        dest="output",
+        type=str,
+        help="Output path, e.g. agent.jsonl.gz",
+    )
+
+    args = parser.parse_args()
+
+    config = {"project_id": args.project_id, "credential": args.credential}
+
+    df = Dialogflow(config)
+    df.get_intents()
+
+    client = EntityClient(config)
+    client.list()
+
+    print(write_agent_jsonl(args.output, df, client))
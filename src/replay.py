@@ -0,0 +1,323 @@
+import json
+import math
+import queue
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from itertools import count
+from uuid import uuid4
+
+from dialogflow import Dialogflow
+from exporter import open_stream, read_jsonl
+
+
+MODE_ORIGINAL = "original"
+MODE_FIXED = "fixed"
+MODE_STEPPED = "stepped"
+
+
+class Recorder:
+    """
+    Appends one compact JSON line per detect_intent call. Pass an instance
+    as config["recorder"] to record a Dialogflow client.
+    """
+
+    def __init__(self, path, compression="infer") -> None:
+        self._fp = open_stream(path, "w", compression)
+        self._lock = threading.Lock()
+        self._origin = time.time()
+
+    def record(self, session_id, query, context_names, started, latency, error=None):
+        """
+        Entries are written as calls finish, so concurrent calls may be
+        logged out of start order; `t` is always relative to the recorder's
+        creation and never negative.
+        """
+        with self._lock:
+            entry = {
+                "t": round(started - self._origin, 6),
+                "session": session_id,
+                "query": query,
+                "contexts": list(context_names),
+                "latency": round(latency, 6),
+                "error": type(error).__name__ if error is not None else None,
+            }
+            self._fp.write(json.dumps(entry, separators=(",", ":")))
+            self._fp.write("\n")
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def original_schedule(records, speed=1.0):
+    """
+    Yield (offset, phase, cycle, record) at the recorded pace. The log is
+    written in finish order, so it is sorted by start offset first.
+    """
+    for record in sorted(records, key=lambda record: record["t"]):
+        yield record["t"] / speed, MODE_ORIGINAL, 0, record
+
+
+def fixed_schedule(records, qps):
+    """
+    Yield (offset, phase, cycle, record) once through records at qps.
+    """
+    for i, record in enumerate(records):
+        yield i / qps, f"{qps}qps", 0, record
+
+
+def stepped_schedule(records, steps):
+    """
+    Yield (offset, phase, cycle, record) for every (qps, duration) step,
+    cycling through records as often as needed. Each step is its own
+    phase, even when steps share a rate.
+    """
+    records = list(records)
+    if not records:
+        return
+
+    offset = 0.0
+    cycle = 0
+    index = 0
+    for step, (qps, duration) in enumerate(steps, 1):
+        phase = f"step{step}:{qps}qps"
+        for i in range(int(qps * duration)):
+            yield offset + i / qps, phase, cycle, records[index]
+            index += 1
+            if index == len(records):
+                index = 0
+                cycle += 1
+        offset += duration
+
+
+def percentile(values, fraction):
+    """
+    Nearest rank percentile of already sorted values.
+    """
+    if not values:
+        return None
+    rank = math.ceil(fraction * len(values)) - 1
+    return values[max(0, min(len(values) - 1, rank))]
+
+
+def distribution(values) -> dict:
+    values = sorted(values)
+
+    return {
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else None,
+    }
+
+
+def summarize(results, duration) -> dict:
+    """
+    Latency is measured from when the schedule said a request was due, so
+    time spent queued behind a busy worker is included; service time and
+    lag break it down into time on the wire and time waiting.
+    """
+    errors = Counter(result["error"] for result in results if result["error"])
+
+    return {
+        "requests": len(results),
+        "errors": dict(errors),
+        "error_rate": sum(errors.values()) / len(results) if results else 0.0,
+        "duration": duration,
+        "throughput": len(results) / duration if duration > 0 else 0.0,
+        "latency": distribution(result["latency"] for result in results),
+        "service_time": distribution(result["service_time"] for result in results),
+        "lag": distribution(result["lag"] for result in results),
+    }
+
+
+class Replayer:
+    """
+    Replays recorded detect_intent traffic with concurrent workers. Every
+    recorded session is pinned to one worker so its turns stay in order;
+    each worker owns its own Dialogflow client, created before the run
+    starts so a bad config fails immediately.
+    :param config: Dialogflow config, "api_endpoint" and "insecure" select
+        the target, e.g. a local stand-in server
+    :param workers: Number of concurrent workers
+    """
+
+    def __init__(self, config, workers=8) -> None:
+        self._config = config
+        self._workers = workers
+
+    def work(self, df, tasks, results, lock):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+
+            due, phase, session_id, record = task
+            started = time.monotonic()
+
+            df.use_session(session_id)
+            try:
+                df.detect_intent(record["query"], record.get("contexts", []))
+                error = None
+            except Exception as e:
+                error = type(e).__name__
+
+            finished = time.monotonic()
+
+            with lock:
+                results.append(
+                    {
+                        "phase": phase,
+                        "latency": finished - due,
+                        "service_time": finished - started,
+                        "lag": max(0.0, started - due),
+                        "error": error,
+                        "finished": finished,
+                    }
+                )
+
+    def run(self, schedule) -> dict:
+        """
+        Dispatch a schedule of (offset, phase, cycle, record) and report
+        throughput, latency percentiles and errors, overall and per phase.
+        """
+        clients = [Dialogflow(self._config) for _ in range(self._workers)]
+
+        queues = [queue.Queue() for _ in range(self._workers)]
+        results = []
+        lock = threading.Lock()
+
+        threads = [
+            threading.Thread(
+                target=self.work, args=(df, tasks, results, lock), daemon=True
+            )
+            for df, tasks in zip(clients, queues)
+        ]
+        for thread in threads:
+            thread.start()
+
+        sessions = {}
+        phases = {}
+        sequence = count()
+        origin = time.monotonic()
+
+        for offset, phase, cycle, record in schedule:
+            due = origin + offset
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            phases.setdefault(phase, (next(sequence), time.monotonic()))
+
+            key = (cycle, record.get("session", ""))
+            if key not in sessions:
+                sessions[key] = uuid4().hex
+            worker = zlib.crc32(sessions[key].encode("utf-8")) % self._workers
+
+            queues[worker].put((due, phase, sessions[key], record))
+
+        for tasks in queues:
+            tasks.put(None)
+        for thread in threads:
+            thread.join()
+
+        finished = time.monotonic()
+
+        by_phase = defaultdict(list)
+        for result in results:
+            by_phase[result["phase"]].append(result)
+
+        ordered = sorted(phases.items(), key=lambda item: item[1][0])
+        report = {"total": summarize(results, finished - origin), "phases": {}}
+        for i, (phase, (_, start)) in enumerate(ordered):
+            if i + 1 < len(ordered):
+                end = ordered[i + 1][1][1]
+            else:
+                end = max((r["finished"] for r in by_phase[phase]), default=finished)
+            report["phases"][phase] = summarize(by_phase[phase], end - start)
+
+        return report
+
+
+def parse_steps(value):
+    """
+    Parse "qps:seconds,qps:seconds" into a list of (qps, seconds).
+    """
+    steps = []
+    for step in value.split(","):
+        qps, duration = step.split(":")
+        steps.append((float(qps), float(duration)))
+    return steps
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--project_id", dest="project_id", type=str, help="Google Cloud Project Id"
+    )
+    parser.add_argument(
+        "--credential",
+        dest="credential",
+        type=str,
+        help="Path to Google Cloud Project credential",
+    )
+    parser.add_argument(
+        "--endpoint", dest="endpoint", type=str, default="", help="API endpoint"
+    )
+    parser.add_argument(
+        "--insecure",
+        dest="insecure",
+        action="store_true",
+        help="Use a plaintext channel, e.g. for a local stand-in server",
+    )
+    parser.add_argument(
+        "--log", dest="log", type=str, help="Traffic log written by Recorder"
+    )
+    parser.add_argument(
+        "--mode",
+        dest="mode",
+        choices=[MODE_ORIGINAL, MODE_FIXED, MODE_STEPPED],
+        default=MODE_ORIGINAL,
+    )
+    parser.add_argument(
+        "--speed", dest="speed", type=float, default=1.0, help="Original pace factor"
+    )
+    parser.add_argument("--qps", dest="qps", type=float, default=1.0)
+    parser.add_argument(
+        "--steps", dest="steps", type=str, default="", help='e.g. "5:30,10:30,20:30"'
+    )
+    parser.add_argument("--workers", dest="workers", type=int, default=8)
+
+    args = parser.parse_args()
+
+    config = {
+        "project_id": args.project_id,
+        "credential": args.credential,
+        "api_endpoint": args.endpoint,
+        "insecure": args.insecure,
+    }
+
+    records = read_jsonl(args.log)
+
+    if args.mode == MODE_FIXED:
+        schedule = fixed_schedule(records, args.qps)
+    elif args.mode == MODE_STEPPED:
+        schedule = stepped_schedule(records, parse_steps(args.steps))
+    else:
+        schedule = original_schedule(records, args.speed)
+
+    report = Replayer(config, args.workers).run(schedule)
+
+    print(json.dumps(report, indent=2))
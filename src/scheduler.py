@@ -0,0 +1,238 @@
+import contextlib
+import threading
+import time
+from collections import defaultdict
+from itertools import count
+
+
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+SESSIONS = "sessions"
+INTENTS = "intents"
+ENTITY_TYPES = "entity_types"
+CONTEXTS = "contexts"
+AGENTS = "agents"
+
+MAX_WAIT = 1.0
+
+
+class TokenBucket:
+    """
+    Classic token bucket. Not thread-safe on its own; the Scheduler
+    guards it with its condition lock.
+    """
+
+    def __init__(self, rate, capacity=None) -> None:
+        self._rate = float(rate)
+        self._capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def tokens(self):
+        self.refill()
+        return self._tokens
+
+    def refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def ready(self) -> bool:
+        return self.tokens >= 1
+
+    def take(self):
+        self.refill()
+        self._tokens -= 1
+
+    def delay(self) -> float:
+        """
+        Seconds until a token is available.
+        """
+        missing = 1 - self.tokens
+        return max(0.0, missing / self._rate) if self._rate > 0 else MAX_WAIT
+
+
+class Scheduler:
+    """
+    Admits RPCs against a shared project quota. Every call belongs to an
+    RPC family with its own token bucket and to a priority class; waiting
+    interactive calls are always admitted before bulk calls that could run.
+    :param project_qps: Rate limit shared by every family, None for no limit
+    :param family_qps: Mapping of RPC family to its rate limit
+    :param max_concurrency: Maximum number of calls in flight
+    :param priority_concurrency: Mapping of priority to its own in-flight cap,
+        e.g. {BULK: 2} keeps slots free for interactive traffic
+    """
+
+    def __init__(
+        self,
+        project_qps=None,
+        family_qps=None,
+        max_concurrency=10,
+        priority_concurrency=None,
+    ) -> None:
+        self._project_bucket = TokenBucket(project_qps) if project_qps else None
+        self._buckets = {
+            family: TokenBucket(qps) for family, qps in (family_qps or {}).items()
+        }
+        self._max_concurrency = max_concurrency
+        self._priority_concurrency = priority_concurrency or {}
+
+        self._condition = threading.Condition()
+        self._sequence = count()
+        self._waiting = {}
+        self._running = defaultdict(int)
+
+        self._admitted = defaultdict(int)
+        self._wait_time = defaultdict(float)
+
+    def bucket(self, family):
+        return self._buckets.get(family)
+
+    def family_ready(self, family) -> bool:
+        bucket = self.bucket(family)
+        return bucket is None or bucket.ready()
+
+    def has_capacity(self, priority) -> bool:
+        if sum(self._running.values()) >= self._max_concurrency:
+            return False
+
+        limit = self._priority_concurrency.get(priority)
+        return limit is None or self._running[priority] < limit
+
+    def is_next(self, ticket) -> bool:
+        """
+        A ticket may run when no better ranked waiter could run right now.
+        """
+        for other, (family, priority) in self._waiting.items():
+            if other >= ticket:
+                continue
+            if other[0] == ticket[0] and family == self._waiting[ticket][0]:
+                return False
+            if self.family_ready(family) and self.has_capacity(priority):
+                return False
+        return True
+
+    def can_run(self, ticket) -> bool:
+        family, priority = self._waiting[ticket]
+
+        if not self.has_capacity(priority) or not self.family_ready(family):
+            return False
+        if self._project_bucket is not None and not self._project_bucket.ready():
+            return False
+
+        return self.is_next(ticket)
+
+    def delay(self, family) -> float:
+        delays = [MAX_WAIT]
+        bucket = self.bucket(family)
+        if bucket is not None:
+            delays.append(bucket.delay())
+        if self._project_bucket is not None:
+            delays.append(self._project_bucket.delay())
+        return max(0.001, min(delays))
+
+    def acquire(self, family, priority=BULK):
+        started = time.monotonic()
+
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            self._waiting[ticket] = (family, priority)
+
+            try:
+                while not self.can_run(ticket):
+                    self._condition.wait(timeout=self.delay(family))
+            finally:
+                del self._waiting[ticket]
+
+            bucket = self.bucket(family)
+            if bucket is not None:
+                bucket.take()
+            if self._project_bucket is not None:
+                self._project_bucket.take()
+
+            self._running[priority] += 1
+            self._admitted[(family, priority)] += 1
+            self._wait_time[(family, priority)] += time.monotonic() - started
+
+            self._condition.notify_all()
+
+    def release(self, priority=BULK):
+        with self._condition:
+            self._running[priority] -= 1
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, family, priority=BULK):
+        self.acquire(family, priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def metrics(self) -> dict:
+        """
+        Snapshot of queue depth, in-flight calls and admission totals,
+        keyed by priority class name and RPC family.
+        """
+        with self._condition:
+            queue_depth = defaultdict(lambda: defaultdict(int))
+            for family, priority in self._waiting.values():
+                queue_depth[PRIORITY_NAMES.get(priority, priority)][family] += 1
+
+            admitted = defaultdict(dict)
+            average_wait = defaultdict(dict)
+            for (family, priority), value in self._admitted.items():
+                name = PRIORITY_NAMES.get(priority, priority)
+                admitted[name][family] = value
+                average_wait[name][family] = (
+                    self._wait_time[(family, priority)] / value
+                )
+
+            return {
+                "queue_depth": {k: dict(v) for k, v in queue_depth.items()},
+                "running": {
+                    PRIORITY_NAMES.get(k, k): v for k, v in self._running.items()
+                },
+                "admitted": dict(admitted),
+                "average_wait": dict(average_wait),
+                "tokens": {
+                    family: bucket.tokens for family, bucket in self._buckets.items()
+                },
+            }
+
+
+def scheduled(scheduler, family, priority=BULK):
+    """
+    Context manager admitting one call through scheduler, or doing nothing
+    when no scheduler is configured.
+    """
+    if scheduler is None:
+        return contextlib.nullcontext()
+    return scheduler.slot(family, priority)
+
+
+def scheduled_pages(scheduler, family, pages, priority=BULK):
+    """
+    Iterate the pages of a list pager, admitting each follow-up page fetch
+    through scheduler so long listings do not hold a slot between pages.
+    The first page was fetched, and admitted, by the list call itself.
+    """
+    pages = iter(pages)
+    page = next(pages, None)
+    while page is not None:
+        yield page
+        if not page.next_page_token:
+            return
+        with scheduled(scheduler, family, priority):
+            page = next(pages, None)
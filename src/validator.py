@@ -0,0 +1,409 @@
+import hashlib
+import json
+import re
+import struct
+from collections import defaultdict
+
+import google.cloud.dialogflow_v2 as dialogflow
+
+from google.cloud.dialogflow_v2.types.intent import Intent as DfIntent
+
+import limits
+
+
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+
+MINHASH_PERMUTATIONS = 32
+MINHASH_BANDS = 8
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+
+def make_issue(code, target, value, limit=None, severity=SEVERITY_ERROR, **extra):
+    issue = {
+        "code": code,
+        "severity": severity,
+        "target": target,
+        "value": value,
+        "limit": limit,
+    }
+    issue.update(extra)
+    return issue
+
+
+def as_intent_obj(intent):
+    if isinstance(intent, dict):
+        return DfIntent(intent)
+    return getattr(intent, "intent_obj", intent)
+
+
+def as_entity_obj(entity_type):
+    if isinstance(entity_type, dict):
+        return dialogflow.EntityType(entity_type)
+    return getattr(entity_type, "entity_obj", entity_type)
+
+
+def phrase_text(phrase) -> str:
+    return "".join(part.text for part in phrase.parts)
+
+
+def check_limit(issues, code, target, value, limit):
+    if value > limit:
+        issues.append(make_issue(code, target, value, limit))
+
+
+def validate_intent(intent) -> list:
+    """
+    Check a single intent against the per intent limits.
+    :param intent: An Intent, DfIntent or intent dict
+    :return: A list of issues
+    """
+    intent_obj = as_intent_obj(intent)
+    target = intent_obj.display_name or intent_obj.name
+    issues = []
+
+    check_limit(
+        issues,
+        "training_phrases_per_intent",
+        target,
+        len(intent_obj.training_phrases),
+        limits.MAX_TRAINING_PHRASES_PER_INTENT_PER_LANG_COUNT,
+    )
+    check_limit(
+        issues,
+        "parameters_per_intent",
+        target,
+        len(intent_obj.parameters),
+        limits.MAX_PARAMETERS_PER_INTENT_COUNT,
+    )
+    check_limit(
+        issues,
+        "input_contexts_per_intent",
+        target,
+        len(intent_obj.input_context_names),
+        limits.MAX_INPUT_CONTEXTS_PER_INTENT_COUNT,
+    )
+    check_limit(
+        issues,
+        "output_contexts_per_intent",
+        target,
+        len(intent_obj.output_contexts),
+        limits.MAX_OUTPUT_CONTEXTS_PER_INTENT_COUNT,
+    )
+    text_responses = defaultdict(int)
+    for message in intent_obj.messages:
+        text_responses[message.platform] += len(message.text.text)
+
+    check_limit(
+        issues,
+        "text_responses_per_intent",
+        target,
+        max(text_responses.values(), default=0),
+        limits.MAX_TEXT_RESPONSES_PER_INTENT_PER_LANG_COUNT,
+    )
+
+    for param in intent_obj.parameters:
+        check_limit(
+            issues,
+            "prompts_per_parameter",
+            f"{target}/{param.display_name}",
+            len(param.prompts),
+            limits.MAX_PROMPTS_PER_PARAMETER_PER_LANG_COUNT,
+        )
+
+    return issues
+
+
+def validate_entity_type(entity_type) -> list:
+    """
+    Check a single entity type against the per entity type limits.
+    :param entity_type: An EntityType, dialogflow.EntityType or dict
+    :return: A list of issues
+    """
+    entity_obj = as_entity_obj(entity_type)
+    target = entity_obj.display_name or entity_obj.name
+    issues = []
+
+    check_limit(
+        issues,
+        "values_per_entity_type",
+        target,
+        len(entity_obj.entities),
+        limits.MAX_ENTITY_VALUES_COUNT,
+    )
+
+    for entity in entity_obj.entities:
+        check_limit(
+            issues,
+            "synonyms_per_entity_value",
+            f"{target}/{entity.value}",
+            len(entity.synonyms),
+            limits.MAX_SYNONYMS_PER_ENTITY_VALUE_COUNT,
+        )
+
+    return issues
+
+
+def merge(updates, existing, as_obj):
+    """
+    Overlay updates on the existing objects, keyed by name when present
+    and by display name otherwise, to get the post update agent.
+    """
+    merged = {}
+    for obj in map(as_obj, existing or []):
+        merged[obj.name or obj.display_name] = obj
+    for obj in map(as_obj, updates):
+        merged[obj.name or obj.display_name] = obj
+    return list(merged.values())
+
+
+def validate_intents(intents, existing=None) -> list:
+    """
+    Check intents against every intent limit in limits.py. Agent wide
+    limits are computed on the existing intents with the updates applied.
+    :param intents: The intents about to be sent
+    :param existing: The intents already on the agent, e.g. the cache
+    :return: A list of issues
+    """
+    issues = []
+    for intent in intents:
+        issues.extend(validate_intent(intent))
+
+    agent = merge(intents, existing, as_intent_obj)
+
+    check_limit(issues, "intents_per_agent", "agent", len(agent), limits.MAX_INTENT_COUNT)
+    check_limit(
+        issues,
+        "training_phrases_per_agent",
+        "agent",
+        sum(len(intent_obj.training_phrases) for intent_obj in agent),
+        limits.MAX_TRAINING_PHRASES_PER_AGENT_PER_LANG_COUNT,
+    )
+
+    return issues
+
+
+def validate_entity_types(entity_types, existing=None) -> list:
+    """
+    Check entity types against every entity limit in limits.py.
+    :param entity_types: The entity types about to be sent
+    :param existing: The entity types already on the agent, e.g. the cache
+    :return: A list of issues
+    """
+    issues = []
+    for entity_type in entity_types:
+        issues.extend(validate_entity_type(entity_type))
+
+    agent = merge(entity_types, existing, as_entity_obj)
+
+    check_limit(
+        issues,
+        "entity_types_per_agent",
+        "agent",
+        len(agent),
+        limits.MAX_ENTITY_TYPES_COUNT,
+    )
+    check_limit(
+        issues,
+        "entity_refs_per_agent",
+        "agent",
+        sum(
+            1 + len(entity.synonyms)
+            for entity_obj in agent
+            for entity in entity_obj.entities
+        ),
+        limits.MAX_ENTITY_REFS__PER_AGENT_PER_LANG_COUNT,
+    )
+
+    return issues
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def shingles(text: str) -> set:
+    words = text.split()
+    result = set(words)
+    result.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return result
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles. Each distinct shingle is hashed
+    once into a vector of `permutations` independent 32 bit values; a
+    phrase signature is the element-wise minimum over its shingles.
+    """
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS) -> None:
+        self._permutations = permutations
+        self._struct = struct.Struct(f"<{permutations}I")
+        self._vectors = {}
+
+    def vector(self, token: str) -> tuple:
+        vector = self._vectors.get(token)
+        if vector is None:
+            digest = hashlib.shake_128(token.encode("utf-8")).digest(
+                self._struct.size
+            )
+            vector = self._vectors[token] = self._struct.unpack(digest)
+        return vector
+
+    def signature(self, tokens: set) -> tuple:
+        if not tokens:
+            return (0,) * self._permutations
+        vectors = [self.vector(token) for token in tokens]
+        return tuple(min(column) for column in zip(*vectors))
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def find_duplicate_phrases(
+    intents,
+    threshold=NEAR_DUPLICATE_THRESHOLD,
+    permutations=MINHASH_PERMUTATIONS,
+    bands=MINHASH_BANDS,
+) -> list:
+    """
+    Find training phrases shared by more than one intent. Exact duplicates
+    are grouped by normalized text; near duplicates are found with MinHash
+    LSH and confirmed with the exact Jaccard similarity of their shingles.
+    :param intents: Intents, DfIntents or intent dicts
+    :param threshold: Minimum Jaccard similarity for a near duplicate
+    :param permutations: MinHash signature length
+    :param bands: Number of LSH bands, must divide permutations
+    :return: A list of warning issues
+    """
+    if permutations % bands:
+        raise Exception("MinHash permutations must be divisible by bands!")
+
+    # normalized text -> {intent display name: original phrase}
+    owners = defaultdict(dict)
+    for intent in intents:
+        intent_obj = as_intent_obj(intent)
+        for phrase in intent_obj.training_phrases:
+            text = phrase_text(phrase)
+            key = normalize(text)
+            if key:
+                owners[key].setdefault(intent_obj.display_name, text)
+
+    issues = []
+    for key, phrases in owners.items():
+        if len(phrases) > 1:
+            issues.append(
+                make_issue(
+                    "duplicate_training_phrase",
+                    sorted(phrases),
+                    key,
+                    severity=SEVERITY_WARNING,
+                    similarity=1.0,
+                    phrases=phrases,
+                )
+            )
+
+    hasher = MinHasher(permutations)
+    rows = permutations // bands
+    buckets = defaultdict(list)
+    keys = list(owners)
+    tokens = [shingles(key) for key in keys]
+
+    for index, token_set in enumerate(tokens):
+        signature = hasher.signature(token_set)
+        for band in range(bands):
+            buckets[(band, signature[band * rows : (band + 1) * rows])].append(index)
+
+    seen = set()
+    for members in buckets.values():
+        for i, left in enumerate(members):
+            for right in members[i + 1 :]:
+                pair = (left, right)
+                if pair in seen:
+                    continue
+                seen.add(pair)
+
+                left_owners = owners[keys[left]]
+                right_owners = owners[keys[right]]
+                names = sorted(set(left_owners) | set(right_owners))
+                if len(names) < 2:
+                    continue
+
+                similarity = jaccard(tokens[left], tokens[right])
+                if similarity < threshold:
+                    continue
+
+                issues.append(
+                    make_issue(
+                        "near_duplicate_training_phrase",
+                        names,
+                        [keys[left], keys[right]],
+                        severity=SEVERITY_WARNING,
+                        similarity=round(similarity, 3),
+                        phrases={"left": left_owners, "right": right_owners},
+                    )
+                )
+
+    return issues
+
+
+def has_errors(issues) -> bool:
+    return any(issue["severity"] == SEVERITY_ERROR for issue in issues)
+
+
+def report(issues) -> str:
+    return json.dumps(
+        {
+            "errors": sum(1 for i in issues if i["severity"] == SEVERITY_ERROR),
+            "warnings": sum(1 for i in issues if i["severity"] == SEVERITY_WARNING),
+            "issues": issues,
+        },
+        indent=2,
+        default=str,
+    )
+
+
+def raise_for_issues(issues):
+    if has_errors(issues):
+        raise Exception(f"Preflight validation failed!\n{report(issues)}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dialogflow import Dialogflow
+    from entities import EntityClient
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--project_id", dest="project_id", type=str, help="Google Cloud Project Id"
+    )
+    parser.add_argument(
+        "--credential",
+        dest="credential",
+        type=str,
+        help="Path to Google Cloud Project credential",
+    )
+
+    args = parser.parse_args()
+
+    config = {"project_id": args.project_id, "credential": args.credential}
+
+    df = Dialogflow(config)
+    df.get_intents()
+
+    client = EntityClient(config)
+    client.list()
+
+    intents = list(df.intents["name"].values())
+    entity_types = list(client.entities["name"].values())
+
+    issues = validate_intents(intents)
+    issues.extend(validate_entity_types(entity_types))
+    issues.extend(find_duplicate_phrases(intents))
+
+    print(report(issues))
@@ -0,0 +1,109 @@
+import pytest
+
+pytest.importorskip("google.cloud.dialogflow_v2")
+
+import google.cloud.dialogflow_v2 as dialogflow
+
+import contexts
+
+SESSION = "projects/p/agent/sessions/s"
+
+
+def make_context(name, lifespan_count):
+    return dialogflow.Context(
+        name=f"{SESSION}/contexts/{name}", lifespan_count=lifespan_count
+    )
+
+
+def make_result(*output_contexts):
+    return dialogflow.QueryResult(output_contexts=list(output_contexts))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(contexts.time, "monotonic", clock)
+    return clock
+
+
+def test_advance_ages_and_drops_contexts():
+    store = contexts.ContextStore(SESSION)
+    store.advance(make_result(make_context("a", 2), make_context("b", 1)))
+
+    assert sorted(store.names()) == ["a", "b"]
+
+    store.advance(make_result())
+
+    assert store.names() == ["a"]
+    assert store.get("a").lifespan_count == 1
+
+    store.advance(make_result(make_context("c", 3)))
+
+    assert store.names() == ["c"]
+
+
+def test_output_context_with_zero_lifespan_is_removed():
+    store = contexts.ContextStore(SESSION)
+    store.advance(make_result(make_context("a", 5)))
+    store.advance(make_result(make_context("a", 0)))
+
+    assert len(store) == 0
+
+
+def test_invalidate_and_load():
+    store = contexts.ContextStore(SESSION)
+    assert store.synced
+
+    store.invalidate()
+    assert not store.synced
+
+    store.load([make_context("a", 3)])
+    assert store.synced
+    assert store.names() == ["a"]
+
+
+def test_expiry_and_reload(clock):
+    store = contexts.ContextStore(SESSION, expiry=60)
+    store.advance(make_result(make_context("a", 5)))
+
+    clock.now += 61
+    assert not store.synced
+
+    store.load([])
+    assert store.synced
+
+    clock.now += 3600
+    assert store.synced
+
+    store.advance(make_result())
+    clock.now += 61
+    assert not store.synced
+
+
+def test_load_before_expiry_is_trusted_until_expiry(clock):
+    store = contexts.ContextStore(SESSION, expiry=60)
+
+    clock.now += 30
+    store.load([make_context("a", 5)])
+    assert store.synced
+
+    clock.now += 31
+    assert not store.synced
+
+
+def test_owns_only_this_session():
+    store = contexts.ContextStore(SESSION)
+    store.load([make_context("a", 5)])
+
+    assert store.owns("a")
+    assert store.owns(f"{SESSION}/contexts/a")
+    assert not store.owns("projects/p/agent/sessions/other/contexts/a")
+    assert store.get("projects/p/agent/sessions/other/contexts/a") is None
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import scheduler
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def queued(s, priority, family):
+    return s.metrics()["queue_depth"].get(priority, {}).get(family, 0)
+
+
+def start(s, family, priority, order, name):
+    def run():
+        with s.slot(family, priority):
+            order.append(name)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_token_bucket():
+    bucket = scheduler.TokenBucket(rate=10, capacity=2)
+
+    assert bucket.ready()
+    bucket.take()
+    bucket.take()
+
+    assert not bucket.ready()
+    assert 0 < bucket.delay() <= 0.1
+
+
+def test_interactive_overtakes_queued_bulk():
+    s = scheduler.Scheduler(max_concurrency=1)
+    order = []
+
+    s.acquire(scheduler.INTENTS, scheduler.BULK)
+
+    threads = []
+    for i in range(3):
+        threads.append(start(s, scheduler.INTENTS, scheduler.BULK, order, f"bulk{i}"))
+        wait_until(lambda: queued(s, "bulk", scheduler.INTENTS) == i + 1)
+
+    threads.append(
+        start(s, scheduler.SESSIONS, scheduler.INTERACTIVE, order, "interactive")
+    )
+    wait_until(lambda: queued(s, "interactive", scheduler.SESSIONS) == 1)
+
+    s.release(scheduler.BULK)
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert order == ["interactive", "bulk0", "bulk1", "bulk2"]
+
+
+def test_priority_concurrency_cap():
+    s = scheduler.Scheduler(max_concurrency=4, priority_concurrency={scheduler.BULK: 1})
+    order = []
+
+    s.acquire(scheduler.INTENTS, scheduler.BULK)
+
+    bulk = start(s, scheduler.INTENTS, scheduler.BULK, order, "bulk")
+    wait_until(lambda: queued(s, "bulk", scheduler.INTENTS) == 1)
+
+    interactive = start(
+        s, scheduler.SESSIONS, scheduler.INTERACTIVE, order, "interactive"
+    )
+    interactive.join(timeout=2)
+
+    assert order == ["interactive"]
+    assert queued(s, "bulk", scheduler.INTENTS) == 1
+
+    s.release(scheduler.BULK)
+    bulk.join(timeout=2)
+
+    assert order == ["interactive", "bulk"]
+
+
+def test_family_rate_limit():
+    s = scheduler.Scheduler(family_qps={scheduler.INTENTS: 20})
+
+    started = time.monotonic()
+    for _ in range(22):
+        with s.slot(scheduler.INTENTS):
+            pass
+
+    # the bucket starts with one second of burst, the last two calls wait
+    assert time.monotonic() - started >= 0.09
+    assert s.metrics()["admitted"] == {"bulk": {scheduler.INTENTS: 22}}
+
+
+def test_scheduled_without_scheduler():
+    with scheduler.scheduled(None, scheduler.INTENTS):
+        pass
@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip("google.cloud.dialogflow_v2")
+
+from google.cloud.dialogflow_v2.types.intent import Intent as DfIntent
+
+import validator
+
+
+def make_intent(display_name, phrases):
+    return DfIntent(
+        display_name=display_name,
+        training_phrases=[
+            {"type_": "EXAMPLE", "parts": [{"text": phrase}]} for phrase in phrases
+        ],
+    )
+
+
+def test_signature_of_single_shingle():
+    hasher = validator.MinHasher(8)
+
+    assert hasher.signature({"hello"}) == hasher.vector("hello")
+    assert len(hasher.signature(set())) == 8
+
+
+def test_one_word_phrases():
+    intents = [
+        make_intent("greet", ["hello", "hi"]),
+        make_intent("smalltalk", ["Hello!", "cancel"]),
+    ]
+
+    issues = validator.find_duplicate_phrases(intents)
+
+    assert [issue["code"] for issue in issues] == ["duplicate_training_phrase"]
+    assert issues[0]["value"] == "hello"
+    assert issues[0]["target"] == ["greet", "smalltalk"]
+
+
+def test_empty_normalized_phrase():
+    intents = [
+        make_intent("a", ["?!", "yes"]),
+        make_intent("b", ["...", "no"]),
+    ]
+
+    assert validator.find_duplicate_phrases(intents) == []
+
+
+def test_near_duplicate_reports_both_sides():
+    intents = [
+        make_intent("a", ["Book a flight, to Paris!"]),
+        make_intent(
+            "b", ["book a flight to paris", "book a flight to paris now please"]
+        ),
+    ]
+
+    issues = validator.find_duplicate_phrases(intents, threshold=0.5)
+    near = [i for i in issues if i["code"] == "near_duplicate_training_phrase"]
+
+    assert len(near) == 1
+    sides = near[0]["phrases"]
+    assert sorted(sides) == ["left", "right"]
+    assert {text for side in sides.values() for text in side.values()} == {
+        "Book a flight, to Paris!",
+        "book a flight to paris",
+        "book a flight to paris now please",
+    }